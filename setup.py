@@ -12,6 +12,12 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/jackoson/squeezebox-controller",
     packages=setuptools.find_packages(),
+    entry_points={
+      'console_scripts': [
+        'squeezebox-controller=squeezebox_controller.cli:main',
+        'squeezebox-gateway=squeezebox_controller.gateway:main',
+      ],
+    },
     install_requires=[
       'requests', 'pylev'
     ],
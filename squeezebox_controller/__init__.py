@@ -3,6 +3,9 @@ import json
 from functools import wraps, partial
 
 from squeezebox_controller.string_distance import dist, try_match
+from squeezebox_controller.records import as_status
+from squeezebox_controller import scene as _scene
+from squeezebox_controller.scheduler import priority_hint, INTERACTIVE
 
 class UserException(Exception):
   pass
@@ -72,12 +75,17 @@ search_types = {
   "PLAYLIST": {"print": "playlist", "local_search":"playlists", "local_loop":"playlists_loop", "local_name": "playlist", "local_play": "playlist_id"},
 }
 
+def _now_playing(info):
+  status = as_status(info)
+  if len(status.playlist) == 0:
+    return "Nothing is playing"
+  track = status.playlist[0]
+  return track.title + ' by ' + track.artist if track.artist is not None else track.title
+
 queries = {
   "RAW": lambda info: info,
-  "VOLUME": lambda info: "The volume is at %d percent"%(info['mixer volume']),
-  "NOW PLAYING": lambda info: info['playlist_loop'][0]['title'] + ' by ' + info['playlist_loop'][0]['artist'] \
-                      if 'artist' in info['playlist_loop'][0] else info['playlist_loop'][0]['title'] \
-                      if 'playlist_loop' in info and len(info['playlist_loop']) > 0 else "Nothing is playing"
+  "VOLUME": lambda info: "The volume is at %d percent"%(as_status(info).volume),
+  "NOW PLAYING": _now_playing
 }
 
 class SqueezeBoxController:
@@ -297,8 +305,8 @@ class SqueezeBoxController:
     master = self.player_macs[details['other']]
 
     self._make_request(master, ["sync",slave])
-    self._make_request(slave, commands["POWER ON"])
-    self._make_request(master, commands["POWER ON"])
+    self._make_request(slave, commands["POWER ON"]["command"])
+    self._make_request(master, commands["POWER ON"]["command"])
 
   def add_custom_command(self, name, func, player_details_cached=True):
     """Set a function as a named custom command.
@@ -364,11 +372,36 @@ class SqueezeBoxController:
     if details['query'] not in queries:
       raise Exception("Query must be one of: " + str(queries.keys()))
 
-    player_info = self._get_player_info(self.player_macs[details['player']])
+    with priority_hint(INTERACTIVE):
+      player_info = self._get_player_info(self.player_macs[details['player']])
 
     return queries[details['query']](player_info)
 
 
+  def apply_scene(self, scene):
+    """Puts several players into a given state at once
+
+    Reads the status of every player in the scene in parallel and only sends the requests needed
+    to reach the scene. Sync groups are set up first, then each player's settings and music are
+    applied, in parallel across players and in order for each player. A failed step stops the
+    later steps for the same player but not for the others.
+
+    Args:
+      scene: {"sync": [[``string``]], "players": {``string``: settings}}
+        - sync is a list of groups, the first player of each being the master; if given,
+          players of the scene in no group are unsynced
+        - settings is {"power": ``boolean``, "volume": ``int``, "shuffle": ``int``,
+          "repeat": ``int``, "play": {"term": ``string``, "type": ``string``, "mode": ``string``}}, all optional
+        - shuffle and repeat are 0 to 2 as in ``commands``, mode is one of "now", "next" or "end"
+        - a player can only be in one group; synced players share a playlist, so shuffle, repeat
+          and play are sent to the group's master and only one player of a group can be given play
+
+    Returns:
+      {"steps": [{"phase": ``string``, "player": ``string``, "step": ``string``, "seconds": ``float``,
+      "error": ``string`` (if failed)}], "seconds": ``float``}
+    """
+    return _scene.apply_scene(self, scene)
+
   def _populate_player_macs(self, playername_cleanup=None):
     player_macs = {}
     count = int(self._make_request('-', ["player","count", "?"])['result']['_count'])
@@ -384,10 +417,13 @@ class SqueezeBoxController:
   def _get_player_info(self, player):
     return self._make_request(player, ["status","-"])["result"]
 
+  def _end_point_for(self, player):
+    return self.end_point_url
+
   def _make_request(self, player, command):
     def handler(p):
       payload = {'method': 'slim.request', 'params': [p, command]}
-      req = self.request_lib.post(self.end_point_url, json=payload)
+      req = self.request_lib.post(self._end_point_for(p), json=payload)
       return json.loads(req.content.decode("utf-8"))
 
     if type(player) == list:
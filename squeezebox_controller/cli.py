@@ -0,0 +1,187 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from squeezebox_controller import SqueezeBoxController, UserException
+from squeezebox_controller.string_distance import try_match
+
+actions = {
+  "command": "simple_command",
+  "search": "search_and_play",
+  "search next": "search_and_play_next",
+  "search end": "search_and_play_end",
+  "query": "simple_query",
+  "volume": "set_volume",
+  "sleep": "sleep_in",
+  "sync": "sync_player",
+  "send": "send_music",
+  "scene": "apply_scene"
+}
+
+def _lane_keys(controller, details):
+  """Canonical names of the players a line acts on, used to keep each player's lines in order"""
+  player_macs = controller.player_macs
+  names = [details[field] for field in ("player", "other") if field in details]
+  names += list(details.get("players", {}).keys())
+  for group in details.get("sync", []):
+    names += list(group)
+  keys = set()
+  for name in names:
+    if name not in player_macs:
+      name = try_match(str(name), player_macs) or str(name).lower()
+    if name == "ALL":
+      keys.update(k for k in player_macs if k != "ALL")
+    else:
+      keys.add(name)
+  return keys
+
+def run_pipeline(controller, lines, out, concurrency=4):
+  """Runs a stream of JSON commands against a controller
+
+  Each line is a ``details`` object with an extra ``"action"`` key (one of ``actions.keys()``);
+  for ``"scene"`` the rest of the line is the scene given to ``apply_scene``.
+  Up to ``concurrency`` lines run at once, but lines for the same player always run in the order
+  they were read. A line without a player uses the last player named earlier in the stream.
+
+  One JSON result is written to ``out`` per line as it finishes:
+  {"line": ``int``, "action": ``string``, "player": ``string``, "result"|"error": ..., "seconds": ``float``}
+
+  Returns:
+    the number of lines that failed
+  """
+  cond = threading.Condition()
+  in_flight = threading.Semaphore(concurrency * 4)
+  lanes = {}
+  pending = [0]
+  failures = [0]
+  last_player = [getattr(controller, "cached_player", None)]
+
+  def emit(record, failed=False):
+    with cond:
+      if failed:
+        failures[0] += 1
+      out.write(json.dumps(record) + "\n")
+      out.flush()
+
+  def ready(job):
+    return not job["started"] and all(lanes[k][0] is job for k in job["keys"])
+
+  def start_job(job):
+    job["started"] = True
+    executor.submit(run, job)
+
+  def run(job):
+    details = job["details"]
+    start = time.time()
+    record = {"line": job["line"], "action": job["action"], "player": details.get("player")}
+    try:
+      record["result"] = getattr(controller, actions[job["action"]])(details)
+      failed = False
+    except Exception as e:
+      record["error"] = str(e)
+      record["user_error"] = isinstance(e, UserException)
+      failed = True
+    record["seconds"] = round(time.time() - start, 4)
+    emit(record, failed)
+
+    with cond:
+      heads = []
+      for k in job["keys"]:
+        lanes[k].popleft()
+        if len(lanes[k]) > 0:
+          heads.append(lanes[k][0])
+        else:
+          del lanes[k]
+      for head in heads:
+        if ready(head):
+          start_job(head)
+      pending[0] -= 1
+      cond.notify_all()
+    in_flight.release()
+
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    for line_no, line in enumerate(lines, 1):
+      line = line.strip()
+      if line == "":
+        continue
+      try:
+        details = json.loads(line)
+        action = details.pop("action")
+        if action not in actions:
+          raise Exception("action must be one of: " + ", ".join(actions.keys()))
+      except Exception as e:
+        emit({"line": line_no, "error": "Bad line: %s"%e, "user_error": False}, True)
+        continue
+
+      if action == "scene":
+        pass
+      elif details.get("player") not in (None, ""):
+        last_player[0] = details["player"]
+      elif last_player[0] is not None:
+        details["player"] = last_player[0]
+      else:
+        emit({"line": line_no, "action": action, "error": "Player not specified", "user_error": False}, True)
+        continue
+
+      try:
+        keys = _lane_keys(controller, details)
+      except Exception as e:
+        emit({"line": line_no, "action": action, "error": "Bad line: %s"%e, "user_error": False}, True)
+        continue
+      job = {"line": line_no, "action": action, "details": details, "keys": keys, "started": False}
+      in_flight.acquire()
+      with cond:
+        pending[0] += 1
+        for k in job["keys"]:
+          lanes.setdefault(k, deque()).append(job)
+        if ready(job):
+          start_job(job)
+
+    with cond:
+      while pending[0] > 0:
+        cond.wait()
+
+  return failures[0]
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Run newline-delimited JSON squeezebox commands.")
+  parser.add_argument("server_ip", nargs="?", help="address of the squeezebox server")
+  parser.add_argument("--server-port", type=int, default=9000)
+  parser.add_argument("--gateway", default=None, metavar="HOST:PORT",
+                      help="send the commands through a running gateway instead of the server")
+  parser.add_argument("--input", "-i", default="-", help="file to read commands from, - for stdin")
+  parser.add_argument("--concurrency", "-j", type=int, default=4)
+  parser.add_argument("--default-player", default=None)
+  args = parser.parse_args(argv)
+
+  if args.gateway is not None:
+    from squeezebox_controller.gateway import SqueezeBoxClient
+    host, _, port = args.gateway.partition(":")
+    controller = SqueezeBoxClient(host, int(port) if port else 9100, args.default_player)
+  elif args.server_ip is not None:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    controller = SqueezeBoxController(args.server_ip, args.server_port,
+                                      default_player=args.default_player, request_lib=session)
+  else:
+    parser.error("either server_ip or --gateway is required")
+
+  start = time.time()
+  lines = sys.stdin if args.input == "-" else open(args.input)
+  try:
+    failures = run_pipeline(controller, lines, sys.stdout, args.concurrency)
+  finally:
+    if lines is not sys.stdin:
+      lines.close()
+  sys.stderr.write("Finished in %.2fs with %d failures\n"%(time.time() - start, failures))
+  return 1 if failures > 0 else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
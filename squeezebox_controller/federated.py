@@ -0,0 +1,89 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from squeezebox_controller import SqueezeBoxController
+
+class FederatedSqueezeBoxController(SqueezeBoxController):
+  """Controls the players of several squeezebox servers as one
+
+  Players are discovered on every server concurrently and merged into one ``player_macs``
+  lookup, so every ``SqueezeBoxController`` method works unchanged: each request is sent to the
+  server the player belongs to, and requests for "ALL" are sent to every server in parallel.
+  A player name found on more than one server gets the server address appended in brackets.
+  Server-wide requests (player ``"-"``) go to the first server.
+
+  Args:
+    servers: ``[string]`` of ``"ip"`` or ``"ip:port"``,
+    playername_cleanup_func: ``(string) -> string``
+      for tidying up the player names got from the squeeze servers
+  """
+
+  def __init__(self, servers, playername_cleanup_func=None, default_player=None, request_lib=requests):
+    if len(servers) == 0:
+      raise Exception("At least one server must be specified")
+    self.end_point_urls = []
+    for server in servers:
+      ip, _, port = server.partition(":")
+      self.end_point_urls.append("http://" + ip + ":" + (port or "9000") + "/jsonrpc.js")
+    self.base_url = self.end_point_urls[0][:-len("/jsonrpc.js")]
+    self.end_point_url = self.end_point_urls[0]
+    self.request_lib = request_lib
+    self._executor = ThreadPoolExecutor(max_workers=max(4, len(servers)))
+    self._player_servers = {}
+    self.player_macs = self._populate_player_macs(playername_cleanup_func)
+    self._custom_commands = {}
+    self.cached_player = default_player
+
+  def _populate_player_macs(self, playername_cleanup=None):
+    def discover(end_point_url):
+      def request(command):
+        payload = {'method': 'slim.request', 'params': ['-', command]}
+        req = self.request_lib.post(end_point_url, json=payload)
+        return json.loads(req.content.decode("utf-8"))
+      count = int(request(["player", "count", "?"])['result']['_count'])
+      return request(["players", "0", count])['result'].get('players_loop', [])
+
+    found = list(self._executor.map(discover, self.end_point_urls))
+
+    names = {}
+    for end_point_url, server_players in zip(self.end_point_urls, found):
+      for player in server_players:
+        name = player['name']
+        assert not name == "ALL"
+        if playername_cleanup != None:
+          name = playername_cleanup(name)
+        names.setdefault(name, []).append((end_point_url, player['playerid']))
+
+    player_macs = {}
+    for name, entries in names.items():
+      for end_point_url, mac in entries:
+        if len(entries) > 1:
+          server = end_point_url[len("http://"):-len("/jsonrpc.js")]
+          player_macs["%s (%s)"%(name, server)] = mac
+        else:
+          player_macs[name] = mac
+        self._player_servers[mac] = end_point_url
+    player_macs["ALL"] = list(player_macs.values())
+    return player_macs
+
+  def _end_point_for(self, player):
+    if player == "-":
+      return self.end_point_url
+    if player not in self._player_servers:
+      raise Exception("Unknown player: %s"%player)
+    return self._player_servers[player]
+
+  def _make_request(self, player, command):
+    if type(player) == str and type(command) == list and len(command) > 0 and command[0] in ("sync", "switchplayer"):
+      if command[0] == "switchplayer":
+        involved = [player] + [c.split(":", 1)[1] for c in command[1:] if c.startswith(("from:", "to:"))]
+      else:
+        involved = [player] + [c for c in command[1:] if c != "-"]
+      if len(set(self._end_point_for(p) for p in involved)) > 1:
+        raise Exception("Players on different servers cannot be synced or switched")
+
+    if type(player) == list:
+      return list(self._executor.map(lambda p: SqueezeBoxController._make_request(self, p, command), player))
+    return SqueezeBoxController._make_request(self, player, command)
@@ -0,0 +1,213 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import requests
+
+from squeezebox_controller import SqueezeBoxController, UserException
+
+exposed_methods = [
+  "simple_command", "search_and_play", "search_and_play_next", "search_and_play_end",
+  "set_volume", "sleep_in", "send_music", "sync_player", "simple_query", "apply_scene"
+]
+
+_no_player_methods = ["apply_scene"]
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+class SqueezeBoxGateway:
+  """Hosts one controller and serves its methods over local HTTP
+
+  Short-lived processes can use a ``SqueezeBoxClient`` pointed at the gateway instead of
+  constructing their own controller, so player discovery, the server connection pool and
+  the compiled matchers are set up once and shared.
+
+  The controller's remembered player is shared by every client, so it is not used: a request
+  (custom commands included) without a player goes to ``default_player`` instead. ``SqueezeBoxClient`` remembers the last
+  player on the client side.
+
+  Args:
+    controller: ``SqueezeBoxController``
+    host: ``string``, interface to listen on
+    port: ``int``, 0 picks a free port
+    default_player: ``string`` for requests that don't name a player, by default the
+      controller's ``default_player``
+  """
+
+  def __init__(self, controller, host="127.0.0.1", port=9100, default_player=None):
+    self.controller = controller
+    self.default_player = default_player if default_player is not None else controller.cached_player
+    self.server = _ThreadingHTTPServer((host, port), self._make_handler())
+    self.host, self.port = self.server.server_address[:2]
+    self._thread = None
+
+  def _make_handler(self):
+    gateway = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path == "/player_macs":
+          self._reply(200, {"result": gateway.controller.player_macs})
+        else:
+          self._reply(404, {"error": "Unknown path: " + self.path})
+
+      def do_POST(self):
+        name = self.path.lstrip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+          body = json.loads(self.rfile.read(length).decode("utf-8")) if length > 0 else {}
+        except ValueError:
+          body = None
+        if not isinstance(body, dict):
+          self._reply(400, {"error": "Request body must be a JSON object"})
+          return
+        try:
+          result = gateway.call(name, body.get("details"))
+        except UserException as e:
+          self._reply(200, {"error": str(e), "user_error": True})
+        except Exception as e:
+          self._reply(200, {"error": str(e), "user_error": False})
+        else:
+          self._reply(200, {"result": result})
+
+      def _reply(self, code, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+  def call(self, name, details=None):
+    """Runs the named controller method
+
+    Args:
+      name: one of ``exposed_methods`` or ``custom_command:<name>`` for a registered custom command
+      details: passed to the method
+    """
+    if name.startswith("custom_command:"):
+      if isinstance(details, dict) and details.get("player") in (None, "") and self.default_player is not None:
+        details["player"] = self.default_player
+      return self.controller.custom_command(name[len("custom_command:"):], details)
+    if name not in exposed_methods:
+      raise Exception("Method must be one of: " + ", ".join(exposed_methods))
+    if not isinstance(details, dict):
+      raise Exception("Details must be a JSON object")
+    if name not in _no_player_methods and details.get("player") in (None, ""):
+      if self.default_player is None:
+        raise Exception("player not specified")
+      details["player"] = self.default_player
+    return getattr(self.controller, name)(details)
+
+  def serve_forever(self):
+    """Serves requests until ``shutdown`` is called"""
+    self.server.serve_forever()
+
+  def start(self):
+    """Serves requests on a background thread"""
+    self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+    self._thread.start()
+
+  def shutdown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+def _remote_method(name):
+  def remote(self, details):
+    if name not in _no_player_methods:
+      self._remember_player(details)
+    return self._call(name, details)
+  remote.__name__ = name
+  remote.__doc__ = getattr(SqueezeBoxController, name).__doc__
+  return remote
+
+class SqueezeBoxClient:
+  """Drop-in substitute for ``SqueezeBoxController`` that forwards to a ``SqueezeBoxGateway``
+
+  Like the controller, the client remembers the last player used for requests that don't name
+  one; until a player is named the gateway's default player is used.
+
+  Args:
+    gateway_ip: ``string``,
+    gateway_port: ``int``,
+    default_player: ``string``,
+    request_lib: library object used for the HTTP calls
+  """
+
+  def __init__(self, gateway_ip="127.0.0.1", gateway_port=9100, default_player=None, request_lib=requests):
+    self.base_url = "http://" + gateway_ip + ":" + str(gateway_port)
+    self.cached_player = default_player
+    self.request_lib = request_lib
+    self._player_macs = None
+
+  @property
+  def player_macs(self):
+    if self._player_macs is None:
+      req = self.request_lib.get(self.base_url + "/player_macs")
+      self._player_macs = self._unwrap(req)
+    return self._player_macs
+
+  def custom_command(self, name, details=None):
+    """Run named custom command registered on the gateway's controller
+
+    Args:
+      name: ``string``
+      details - passed to custom command
+    """
+    if isinstance(details, dict):
+      self._remember_player(details)
+    return self._call("custom_command:" + name, details)
+
+  def _remember_player(self, details):
+    if self.cached_player is not None and details.get("player") in (None, ""):
+      details["player"] = self.cached_player
+    elif details.get("player") not in (None, ""):
+      self.cached_player = details["player"]
+
+  def _call(self, name, details):
+    req = self.request_lib.post(self.base_url + "/" + name, json={"details": details})
+    return self._unwrap(req)
+
+  def _unwrap(self, req):
+    response = json.loads(req.content.decode("utf-8"))
+    if "error" in response:
+      if response.get("user_error"):
+        raise UserException(response["error"])
+      raise Exception(response["error"])
+    return response["result"]
+
+for _name in exposed_methods:
+  setattr(SqueezeBoxClient, _name, _remote_method(_name))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Serve a squeezebox controller to local clients.")
+  parser.add_argument("server_ip", help="address of the squeezebox server")
+  parser.add_argument("--server-port", type=int, default=9000)
+  parser.add_argument("--host", default="127.0.0.1", help="interface for the gateway to listen on")
+  parser.add_argument("--port", type=int, default=9100, help="port for the gateway to listen on")
+  parser.add_argument("--default-player", default=None)
+  args = parser.parse_args(argv)
+
+  controller = SqueezeBoxController(args.server_ip, args.server_port,
+                                    default_player=args.default_player, request_lib=requests.Session())
+  gateway = SqueezeBoxGateway(controller, args.host, args.port, args.default_player)
+  try:
+    gateway.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    gateway.server.server_close()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,150 @@
+import gzip
+import json
+import threading
+import time
+
+import requests
+
+def _open(path, mode):
+  if path.endswith(".gz"):
+    return gzip.open(path, mode + "t", encoding="utf-8")
+  return open(path, mode, encoding="utf-8")
+
+def _key(payload):
+  params = payload["params"] if payload is not None and "params" in payload else [None, None]
+  return json.dumps(params, separators=(",", ":"))
+
+def load_recording(path):
+  """Reads the records written by a ``RecordingRequestLib``
+
+  Returns a list of {"at": ``float``, "params": [player, command], "latency": ``float``, "response": ``string``}
+  where ``at`` is seconds since recording started.
+  """
+  with _open(path, "r") as f:
+    return [json.loads(line) for line in f if line.strip() != ""]
+
+class RecordingRequestLib:
+  """Records the traffic a controller sends to the server
+
+  Pass one as the ``request_lib`` of a controller. Every request is passed on to ``request_lib``
+  and written to ``path`` as one JSON line with its ``(player, command)``, the time it was sent,
+  how long it took and the response body. Paths ending in ``.gz`` are gzipped.
+
+  Args:
+    path: ``string``,
+    request_lib: library object that actually sends the requests
+  """
+
+  def __init__(self, path, request_lib=requests):
+    self.path = path
+    self.request_lib = request_lib
+    self._lock = threading.Lock()
+    self._file = _open(path, "w")
+    self._started = time.time()
+
+  def post(self, url, **kwargs):
+    start = time.time()
+    req = self.request_lib.post(url, **kwargs)
+    latency = time.time() - start
+    payload = kwargs.get("json")
+    record = {
+      "at": round(start - self._started, 4),
+      "params": payload["params"] if payload is not None else None,
+      "latency": round(latency, 4),
+      "response": req.content.decode("utf-8")
+    }
+    with self._lock:
+      self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+    return req
+
+  def close(self):
+    with self._lock:
+      self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+class _Response:
+  def __init__(self, content):
+    self.content = content
+    self.status_code = 200
+
+class ReplayRequestLib:
+  """Serves recorded responses instead of talking to a server
+
+  Each request is answered with the next recorded response for the same ``(player, command)``,
+  going back to the first once they have all been used, so polling sees state change as it did
+  when recorded.
+
+  Args:
+    path: ``string`` of a file written by ``RecordingRequestLib``,
+    latency: ``"original"`` to wait as long as the recorded request took, ``"none"`` to answer
+      at once, or a ``float`` to scale the recorded latencies by
+    strict: ``boolean`` - if ``True`` requests that were never recorded raise an exception,
+      otherwise they get ``{"result": {}}``
+  """
+
+  def __init__(self, path, latency="original", strict=True):
+    if latency == "original":
+      self.scale = 1.0
+    elif latency == "none":
+      self.scale = 0.0
+    else:
+      try:
+        self.scale = float(latency)
+      except (TypeError, ValueError):
+        raise Exception('latency must be "original", "none" or a number')
+    self.strict = strict
+    self._lock = threading.Lock()
+    self._responses = {}
+    self._next = {}
+    for record in load_recording(path):
+      key = json.dumps(record["params"], separators=(",", ":"))
+      self._responses.setdefault(key, []).append((record["latency"], record["response"]))
+    self._counts = {"hits": 0, "misses": 0}
+
+  def post(self, url, **kwargs):
+    key = _key(kwargs.get("json"))
+    with self._lock:
+      if key not in self._responses:
+        self._counts["misses"] += 1
+        if self.strict:
+          raise Exception("No recorded response for " + key)
+        return _Response(b'{"result": {}}')
+      self._counts["hits"] += 1
+      index = self._next.get(key, 0)
+      self._next[key] = (index + 1) % len(self._responses[key])
+      latency, response = self._responses[key][index]
+    if self.scale > 0:
+      time.sleep(latency * self.scale)
+    return _Response(response.encode("utf-8"))
+
+  def stats(self):
+    with self._lock:
+      return dict(self._counts)
+
+def replay_traffic(path, request_lib, end_point_url="http://127.0.0.1:9000/jsonrpc.js", keep_timing=False):
+  """Sends the requests of a recording again, in order
+
+  Useful with a ``ReplayRequestLib`` wrapped in the transport layers under test (scheduler,
+  resilience) to compare throughput between versions.
+
+  Args:
+    keep_timing: ``boolean`` - wait until each request's original offset before sending it
+
+  Returns:
+    {"requests": ``int``, "seconds": ``float``, "per_second": ``float``}
+  """
+  records = load_recording(path)
+  start = time.time()
+  for record in records:
+    if keep_timing:
+      delay = record["at"] - (time.time() - start)
+      if delay > 0:
+        time.sleep(delay)
+    request_lib.post(end_point_url, json={"method": "slim.request", "params": record["params"]})
+  seconds = time.time() - start
+  return {"requests": len(records), "seconds": seconds, "per_second": len(records) / seconds if seconds > 0 else 0.0}
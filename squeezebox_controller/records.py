@@ -0,0 +1,119 @@
+import sys
+
+def _intern(value):
+  return sys.intern(value) if type(value) == str else value
+
+class _Record:
+  __slots__ = ()
+
+  def __eq__(self, other):
+    return type(self) == type(other) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+  def __repr__(self):
+    return "%s(%s)"%(type(self).__name__, ", ".join("%s=%r"%(f, getattr(self, f)) for f in self.__slots__))
+
+class Player(_Record):
+  """A player from a ``players_loop``"""
+  __slots__ = ["id", "name", "model", "ip", "connected", "power"]
+
+  def __init__(self, id, name, model=None, ip=None, connected=None, power=None):
+    self.id = id
+    self.name = name
+    self.model = _intern(model)
+    self.ip = ip
+    self.connected = connected
+    self.power = power
+
+  @classmethod
+  def from_json(cls, entry):
+    return cls(entry['playerid'], entry['name'], entry.get('model'), entry.get('ip'),
+               entry.get('connected'), entry.get('power'))
+
+class Track(_Record):
+  """A track from a ``titles_loop`` or ``playlist_loop``"""
+  __slots__ = ["id", "title", "artist", "album", "duration"]
+
+  def __init__(self, id, title, artist=None, album=None, duration=None):
+    self.id = id
+    self.title = title
+    self.artist = _intern(artist)
+    self.album = _intern(album)
+    self.duration = duration
+
+  @classmethod
+  def from_json(cls, entry):
+    return cls(entry.get('id'), entry.get('title'), entry.get('artist'), entry.get('album'),
+               entry.get('duration'))
+
+class Album(_Record):
+  """An album from an ``albums_loop``"""
+  __slots__ = ["id", "album", "artist"]
+
+  def __init__(self, id, album, artist=None):
+    self.id = id
+    self.album = _intern(album)
+    self.artist = _intern(artist)
+
+  @classmethod
+  def from_json(cls, entry):
+    return cls(entry['id'], entry['album'], entry.get('artist'))
+
+class Artist(_Record):
+  """An artist from an ``artists_loop``"""
+  __slots__ = ["id", "artist"]
+
+  def __init__(self, id, artist):
+    self.id = id
+    self.artist = _intern(artist)
+
+  @classmethod
+  def from_json(cls, entry):
+    return cls(entry['id'], entry['artist'])
+
+class PlayerStatus(_Record):
+  """The result of a ``status`` request"""
+  __slots__ = ["mode", "power", "volume", "shuffle", "repeat", "playlist_index", "playlist", "sync_master"]
+
+  def __init__(self, mode=None, power=None, volume=None, shuffle=None, repeat=None, playlist_index=None, playlist=(),
+               sync_master=None):
+    self.mode = _intern(mode)
+    self.power = power
+    self.volume = volume
+    self.shuffle = shuffle
+    self.repeat = repeat
+    self.playlist_index = playlist_index
+    self.playlist = tuple(playlist)
+    self.sync_master = sync_master
+
+  @classmethod
+  def from_json(cls, result):
+    return cls(result.get('mode'), result.get('power'), result.get('mixer volume'),
+               result.get('playlist shuffle'), result.get('playlist repeat'),
+               result.get('playlist_cur_index'), from_loop('playlist_loop', result.get('playlist_loop', [])),
+               result.get('sync_master'))
+
+_loop_records = {
+  "players_loop": Player,
+  "titles_loop": Track,
+  "playlist_loop": Track,
+  "albums_loop": Album,
+  "artists_loop": Artist
+}
+
+def from_loop(loop_name, loop):
+  """Converts the entries of a raw ``*_loop`` list into records
+
+  Args:
+    loop_name: ``string``, one of ``players_loop``, ``titles_loop``, ``playlist_loop``, ``albums_loop`` or ``artists_loop``
+    loop: ``[JSON]``
+  """
+  if loop_name not in _loop_records:
+    raise Exception("loop_name must be one of: " + ", ".join(_loop_records.keys()))
+  record = _loop_records[loop_name]
+  return [record.from_json(entry) for entry in loop]
+
+def as_status(info):
+  """Returns ``info`` as a ``PlayerStatus``, converting it if it is the raw JSON"""
+  if isinstance(info, PlayerStatus):
+    return info
+  return PlayerStatus.from_json(info)
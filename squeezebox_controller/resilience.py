@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+_read_commands = ["status", "tracks", "albums", "artists", "genres", "playlists", "players", "player"]
+
+class CircuitOpen(Exception):
+  pass
+
+def is_read(payload):
+  """Whether a JSON RPC payload only reads state, so is safe to send again"""
+  try:
+    command = payload["params"][1]
+    name = command[0]
+  except (KeyError, IndexError, TypeError):
+    return False
+  if name == "player":
+    return len(command) > 2 and command[-1] == "?"
+  return name in _read_commands
+
+class ResilientRequestLib:
+  """Adds timeouts, retries, hedging and a circuit breaker to the requests sent to the server
+
+  Pass one as the ``request_lib`` of a controller. Every request gets a ``timeout``. Reads (see
+  ``is_read``) that fail with a connection error or timeout are retried up to ``retries`` times
+  with jittered exponential backoff, as long as the ``deadline`` for the whole call allows.
+  If ``hedge_percentile`` is set, a read still waiting after that percentile of recent read
+  latencies gets a second identical request and whichever answers first is used.
+
+  After ``failure_threshold`` calls in a row fail, the circuit opens: calls fail at once with
+  ``CircuitOpen`` for ``reset_after`` seconds, then one call is let through to test the server.
+
+  Args:
+    request_lib: library object that actually sends the requests,
+    timeout: ``float`` seconds for each attempt,
+    deadline: ``float`` seconds for a call including retries, or ``None``,
+    retries: ``int``,
+    backoff: ``float`` seconds before the first retry, doubled each time,
+    hedge_percentile: ``float`` 0 to 100, or ``None`` to never hedge,
+    failure_threshold: ``int``,
+    reset_after: ``float`` seconds
+  """
+
+  retry_on = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+  def __init__(self, request_lib=requests, timeout=5.0, deadline=15.0, retries=2, backoff=0.1,
+               hedge_percentile=None, failure_threshold=5, reset_after=10.0):
+    self.request_lib = request_lib
+    self.timeout = timeout
+    self.deadline = deadline
+    self.retries = retries
+    self.backoff = backoff
+    self.hedge_percentile = hedge_percentile
+    self.failure_threshold = failure_threshold
+    self.reset_after = reset_after
+
+    self._lock = threading.Lock()
+    self._latencies = deque(maxlen=1000)
+    self._failures = 0
+    self._opened_at = None
+    self._trial_running = False
+    self._counts = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "rejected": 0}
+    self._executor = None
+
+  def post(self, url, **kwargs):
+    trial = self._check_circuit()
+    try:
+      result = self._call(url, kwargs)
+    except Exception:
+      self._record_outcome(False, trial)
+      raise
+    self._record_outcome(True, trial)
+    return result
+
+  def _check_circuit(self):
+    """Returns whether the call is the trial call of a half-open circuit, raises if the circuit is open"""
+    with self._lock:
+      self._counts["calls"] += 1
+      if self._opened_at is None:
+        return False
+      if time.time() - self._opened_at >= self.reset_after and not self._trial_running:
+        self._trial_running = True
+        return True
+      self._counts["rejected"] += 1
+    raise CircuitOpen("Squeezebox server is not responding")
+
+  def _record_outcome(self, success, trial):
+    with self._lock:
+      if trial:
+        self._trial_running = False
+      if success:
+        self._failures = 0
+        self._opened_at = None
+      else:
+        self._counts["failures"] += 1
+        self._failures += 1
+        if self._failures >= self.failure_threshold or self._opened_at is not None:
+          self._opened_at = time.time()
+
+  def _call(self, url, kwargs):
+    read = is_read(kwargs.get("json"))
+    start = time.time()
+    attempt = 0
+    while True:
+      timeout = self.timeout
+      if self.deadline is not None:
+        timeout = min(timeout, self.deadline - (time.time() - start))
+        if timeout <= 0:
+          raise requests.exceptions.Timeout("Deadline of %ss exceeded"%self.deadline)
+      try:
+        if read and self.hedge_percentile is not None:
+          return self._hedged(url, kwargs, timeout)
+        return self._send(url, kwargs, timeout, read)
+      except self.retry_on:
+        attempt += 1
+        if not read or attempt > self.retries:
+          raise
+        delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+        if self.deadline is not None and time.time() - start + delay >= self.deadline:
+          raise
+        with self._lock:
+          self._counts["retries"] += 1
+        time.sleep(delay)
+
+  def _send(self, url, kwargs, timeout, read):
+    start = time.time()
+    req = self.request_lib.post(url, timeout=timeout, **kwargs)
+    if read:
+      with self._lock:
+        self._latencies.append(time.time() - start)
+    return req
+
+  def _hedged(self, url, kwargs, timeout):
+    hedge_after = self.percentile(self.hedge_percentile)
+    if hedge_after is None or hedge_after >= timeout:
+      return self._send(url, kwargs, timeout, True)
+
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=8)
+    first = self._executor.submit(self._send, url, kwargs, timeout, True)
+    done, _ = wait([first], timeout=hedge_after)
+    if first in done:
+      return first.result()
+
+    with self._lock:
+      self._counts["hedges"] += 1
+    second = self._executor.submit(self._send, url, kwargs, timeout - hedge_after, True)
+    pending = [first, second]
+    error = None
+    while len(pending) > 0:
+      done, _ = wait(pending, return_when=FIRST_COMPLETED)
+      for f in done:
+        pending.remove(f)
+        if f.exception() is None:
+          if f is second:
+            with self._lock:
+              self._counts["hedge_wins"] += 1
+          return f.result()
+        error = f.exception()
+    raise error
+
+  def percentile(self, p):
+    """Read latency (seconds) at percentile ``p`` of recent reads, ``None`` until there are enough samples"""
+    with self._lock:
+      samples = sorted(self._latencies)
+    if len(samples) < 20:
+      return None
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100.0))]
+
+  def stats(self):
+    """Counts, circuit state and recent read latency percentiles (in seconds)"""
+    latencies = {"p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99)}
+    with self._lock:
+      stats = dict(self._counts)
+      stats["circuit"] = "closed" if self._opened_at is None else "open"
+    stats["latency"] = latencies
+    return stats
@@ -0,0 +1,213 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from squeezebox_controller.records import PlayerStatus
+from squeezebox_controller.scheduler import priority_hint, INTERACTIVE
+from squeezebox_controller.string_distance import try_match
+
+play_modes = {"now": "load", "next": "insert", "end": "add"}
+
+def _as_int(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+def _resolve(controller, name):
+  if name in controller.player_macs and name != "ALL":
+    return name
+  player = try_match(name, controller.player_macs)
+  if player is None or player == "ALL":
+    raise Exception("player must be one of: %s"%", ".join(k for k in controller.player_macs if k != "ALL"))
+  return player
+
+def _declared_groups(scene):
+  """Maps each player in a sync group of the scene to the group's master"""
+  masters = {}
+  for group in scene.get("sync", []):
+    if len(group) == 0:
+      raise Exception("Sync groups cannot be empty")
+    for player in group:
+      if player in masters:
+        raise Exception("%s is in more than one sync group"%player)
+      masters[player] = group[0]
+  return masters
+
+def _playlist_targets(scene, group_of):
+  """Merges the shuffle, repeat and play targets of the players sharing a playlist
+
+  Players synced together share one playlist, so these are set once per group, on the player
+  ``group_of`` names. Raises if players of one group ask for different things.
+
+  Returns:
+    {sender player: {"shuffle": ``int``, "repeat": ``int``, "play": details}} (keys optional)
+  """
+  targets = {}
+  for player, target in scene.get("players", {}).items():
+    sender = group_of(player)
+    merged = targets.setdefault(sender, {})
+    for field in ("shuffle", "repeat"):
+      if field in target:
+        if field in merged and merged[field] != int(target[field]):
+          raise Exception("Players synced with %s ask for different %s settings"%(sender, field))
+        merged[field] = int(target[field])
+    if "play" in target:
+      if "play" in merged:
+        raise Exception("Only one player synced with %s can be given something to play"%sender)
+      merged["play"] = target["play"]
+  return targets
+
+def check_scene(scene):
+  """Raises an exception if a scene is not valid, before any request is made for it
+
+  Expects the player names of the scene to already be resolved.
+  """
+  if not isinstance(scene, dict):
+    raise Exception("Scene must be a dictionary")
+  masters = _declared_groups(scene)
+  for player, target in scene.get("players", {}).items():
+    if "volume" in target:
+      try:
+        volume = int(target["volume"])
+      except (TypeError, ValueError):
+        raise Exception("Volume must be a integer")
+      if volume < 0 or volume > 100:
+        raise Exception("Volume must be between 0 and 100")
+    for field in ("shuffle", "repeat"):
+      if field in target and _as_int(target[field]) not in (0, 1, 2):
+        raise Exception("%s must be 0, 1 or 2"%field.capitalize())
+    if "play" in target:
+      if "term" not in target["play"]:
+        raise Exception("Search term not specified")
+      if target["play"].get("mode", "now") not in play_modes:
+        raise Exception("Play mode must be one of: " + ", ".join(play_modes.keys()))
+  _playlist_targets(scene, lambda player: masters.get(player, player))
+
+def plan_scene(controller, scene, statuses):
+  """Works out the requests needed to get from the current state to a scene
+
+  Shuffle, repeat and play apply to a whole sync group's playlist, so they are compared against
+  and sent to the group's master (for groups left as they are, the first player of the scene in
+  the group).
+
+  Args:
+    scene: see ``SqueezeBoxController.apply_scene``, with resolved player names
+    statuses: ``dict[player name] -> PlayerStatus`` for every player in the scene
+
+  Returns:
+    [(phase name, {chain key: [(player, step, request)]})]; phases run one after another, the
+    chains of a phase run in parallel and the steps of a chain run in order.
+    ``request`` is either a command list or a details dict for a search.
+  """
+  check_scene(scene)
+  macs = controller.player_macs
+  masters = _declared_groups(scene)
+  sync_chains = {}
+  if "sync" in scene:
+    for group in scene["sync"]:
+      master = group[0]
+      chain = []
+      if statuses[master].sync_master not in (None, macs[master]):
+        chain.append((master, "unsync", ["sync", "-"]))
+      for slave in group[1:]:
+        if slave != master and statuses[slave].sync_master != macs[master]:
+          chain.append((master, "sync " + slave, ["sync", macs[slave]]))
+      if len(chain) > 0:
+        sync_chains[master] = chain
+    for player in statuses:
+      if player not in masters and statuses[player].sync_master is not None:
+        sync_chains[player] = [(player, "unsync", ["sync", "-"])]
+    group_of = lambda player: masters.get(player, player)
+  else:
+    senders = {}
+    def group_of(player):
+      shared = statuses[player].sync_master or macs[player]
+      return senders.setdefault(shared, player)
+
+  setting_chains = {}
+  for player, target in scene.get("players", {}).items():
+    status = statuses[player]
+    chain = []
+    if "power" in target and _as_int(status.power) != int(bool(target["power"])):
+      chain.append((player, "power", ["power", "1" if target["power"] else "0"]))
+    if "volume" in target and _as_int(status.volume) != int(target["volume"]):
+      chain.append((player, "volume", ["mixer", "volume", str(int(target["volume"]))]))
+    if len(chain) > 0:
+      setting_chains[player] = chain
+
+  for sender, merged in _playlist_targets(scene, group_of).items():
+    status = statuses[sender]
+    chain = setting_chains.get(sender, [])
+    for field in ("shuffle", "repeat"):
+      if field in merged and _as_int(getattr(status, field)) != merged[field]:
+        chain.append((sender, field, ["playlist", field, merged[field]]))
+    if "play" in merged:
+      play = dict(merged["play"])
+      mode = play.pop("mode", "now")
+      play["player"] = sender
+      play.setdefault("type", "")
+      chain.append((sender, "play", (play, play_modes[mode])))
+    if len(chain) > 0:
+      setting_chains[sender] = chain
+
+  return [(name, chains) for name, chains in [("sync", sync_chains), ("settings", setting_chains)] if len(chains) > 0]
+
+def apply_scene(controller, scene):
+  """Implements ``SqueezeBoxController.apply_scene``"""
+  start = time.time()
+  if not isinstance(scene, dict):
+    raise Exception("Scene must be a dictionary")
+  scene = dict(scene)
+  players = {}
+  for name, target in scene.get("players", {}).items():
+    player = _resolve(controller, name)
+    if player in players:
+      raise Exception("%s is given more than once"%player)
+    players[player] = target
+  scene["players"] = players
+  if "sync" in scene:
+    scene["sync"] = [[_resolve(controller, name) for name in group] for group in scene["sync"]]
+  check_scene(scene)
+
+  involved = set(players.keys())
+  for group in scene.get("sync", []):
+    involved.update(group)
+  involved = sorted(involved)
+
+  report = []
+
+  def run_chain(phase, chain):
+    records = []
+    for player, step, request in chain:
+      step_start = time.time()
+      record = {"phase": phase, "player": player, "step": step}
+      try:
+        if type(request) == tuple:
+          details, command = request
+          record["result"] = controller._search_and(details, command)
+        else:
+          controller._make_request(controller.player_macs[player], request)
+      except Exception as e:
+        record["error"] = str(e)
+      record["seconds"] = round(time.time() - step_start, 4)
+      records.append(record)
+      if "error" in record:
+        break
+    return records
+
+  with ThreadPoolExecutor(max_workers=max(1, len(involved))) as executor:
+    status_start = time.time()
+    def read_status(player):
+      with priority_hint(INTERACTIVE):
+        return controller._get_player_info(controller.player_macs[player])
+    results = executor.map(read_status, involved)
+    statuses = dict((p, PlayerStatus.from_json(r)) for p, r in zip(involved, results))
+    report.append({"phase": "status", "player": None, "step": "status",
+                   "seconds": round(time.time() - status_start, 4)})
+
+    for phase_name, chains in plan_scene(controller, scene, statuses):
+      futures = [executor.submit(run_chain, phase_name, chain) for chain in chains.values()]
+      for f in futures:
+        report.extend(f.result())
+
+  return {"steps": report, "seconds": round(time.time() - start, 4)}
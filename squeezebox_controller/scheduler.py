@@ -0,0 +1,188 @@
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+INTERACTIVE = 0
+SEARCH = 1
+POLLING = 2
+
+priority_names = {INTERACTIVE: "interactive", SEARCH: "search", POLLING: "polling"}
+
+_search_commands = ["tracks", "albums", "artists", "genres", "playlists", "players", "player"]
+_polling_commands = ["status"]
+
+_hint = threading.local()
+
+class RequestShed(Exception):
+  pass
+
+@contextmanager
+def priority_hint(priority):
+  """Sets the priority class of the requests made by this thread inside the ``with`` block
+
+  Overrides the scheduler's ``priority_for``. The controller uses it to mark the status reads
+  that answer a user (``simple_query``, ``apply_scene``) as interactive rather than polling.
+  """
+  previous = getattr(_hint, "priority", None)
+  _hint.priority = priority
+  try:
+    yield
+  finally:
+    _hint.priority = previous
+
+def default_priority(payload):
+  """Works out the priority class of a JSON RPC payload from its command
+
+  ``status`` requests are background polling, searches and player listings are searches and
+  everything else (commands that change what a player is doing) is interactive. Callers reading
+  status on behalf of a user should wrap the call in ``priority_hint(INTERACTIVE)``.
+  """
+  try:
+    command = payload["params"][1]
+    name = command[0]
+  except (KeyError, IndexError, TypeError):
+    return INTERACTIVE
+  if name in _polling_commands:
+    return POLLING
+  if name in _search_commands:
+    return SEARCH
+  return INTERACTIVE
+
+class RequestScheduler:
+  """Schedules the requests sent to the squeezebox server by priority
+
+  Pass one as the ``request_lib`` of a controller. Waiting requests are let through highest
+  priority first, no more than ``max_concurrent`` at a time and ``max_per_second`` per second.
+  When more than ``max_queue`` requests are waiting, the lowest priority waiting request
+  (newest first) is shed by raising ``RequestShed`` in its caller; interactive requests are never shed.
+
+  The priority of a request is set by ``priority_hint`` if the calling thread is inside one,
+  otherwise by ``priority_for``. A status read made outside a hint, e.g. by a custom command
+  or a dashboard calling ``_get_player_info``, counts as polling.
+
+  Args:
+    request_lib: library object that actually sends the requests,
+    max_concurrent: ``int``,
+    max_per_second: ``float`` or ``None`` for no limit,
+    max_queue: ``int``,
+    priority_for: ``(payload) -> int`` priority class of a JSON RPC payload, lower runs first
+  """
+
+  def __init__(self, request_lib=requests, max_concurrent=4, max_per_second=None, max_queue=32,
+               priority_for=default_priority):
+    if max_concurrent < 1:
+      raise Exception("max_concurrent must be at least 1")
+    self.request_lib = request_lib
+    self.max_concurrent = max_concurrent
+    self.max_per_second = max_per_second
+    self.max_queue = max_queue
+    self.priority_for = priority_for
+
+    self._cond = threading.Condition()
+    self._queue = []
+    self._shed = set()
+    self._seq = 0
+    self._in_flight = 0
+    self._tokens = max(1.0, max_per_second or 0)
+    self._last_refill = time.time()
+    self._metrics = {}
+
+  def post(self, url, **kwargs):
+    priority = getattr(_hint, "priority", None)
+    if priority is None:
+      priority = self.priority_for(kwargs.get("json"))
+    entry = self._acquire(priority)
+    try:
+      return self.request_lib.post(url, **kwargs)
+    finally:
+      self._release(entry)
+
+  def get(self, url, **kwargs):
+    entry = self._acquire(INTERACTIVE)
+    try:
+      return self.request_lib.get(url, **kwargs)
+    finally:
+      self._release(entry)
+
+  def _metric(self, priority):
+    if priority not in self._metrics:
+      self._metrics[priority] = {"dispatched": 0, "shed": 0, "total_wait": 0.0, "max_wait": 0.0}
+    return self._metrics[priority]
+
+  def _refill(self, now):
+    if self.max_per_second is None:
+      return
+    self._tokens = min(max(1.0, self.max_per_second),
+                       self._tokens + (now - self._last_refill) * self.max_per_second)
+    self._last_refill = now
+
+  def _shed_one(self):
+    candidates = [e for e in self._queue if e[0] > INTERACTIVE and e not in self._shed]
+    if len(candidates) == 0:
+      return
+    victim = max(candidates)
+    self._shed.add(victim)
+    self._queue.remove(victim)
+    heapq.heapify(self._queue)
+    self._cond.notify_all()
+
+  def _acquire(self, priority):
+    start = time.time()
+    with self._cond:
+      self._seq += 1
+      entry = (priority, self._seq)
+      heapq.heappush(self._queue, entry)
+      self._metric(priority)
+      if len(self._queue) > self.max_queue:
+        self._shed_one()
+
+      while True:
+        if entry in self._shed:
+          self._shed.remove(entry)
+          self._metric(priority)["shed"] += 1
+          raise RequestShed("Server is busy, %s request dropped"%priority_names.get(priority, priority))
+
+        timeout = None
+        if self._queue[0] == entry and self._in_flight < self.max_concurrent:
+          now = time.time()
+          self._refill(now)
+          if self.max_per_second is None or self._tokens >= 1:
+            heapq.heappop(self._queue)
+            if self.max_per_second is not None:
+              self._tokens -= 1
+            self._in_flight += 1
+            waited = now - start
+            metric = self._metric(priority)
+            metric["dispatched"] += 1
+            metric["total_wait"] += waited
+            metric["max_wait"] = max(metric["max_wait"], waited)
+            self._cond.notify_all()
+            return entry
+          timeout = (1 - self._tokens) / self.max_per_second
+        self._cond.wait(timeout)
+
+  def _release(self, entry):
+    with self._cond:
+      self._in_flight -= 1
+      self._cond.notify_all()
+
+  def stats(self):
+    """Current queue state and per priority class counts and wait times (in seconds)"""
+    with self._cond:
+      depths = {}
+      for priority, _ in self._queue:
+        depths[priority] = depths.get(priority, 0) + 1
+      classes = {}
+      for priority, metric in self._metrics.items():
+        waits = metric["dispatched"]
+        classes[priority_names.get(priority, priority)] = {
+          "queued": depths.get(priority, 0),
+          "dispatched": metric["dispatched"],
+          "shed": metric["shed"],
+          "mean_wait": metric["total_wait"] / waits if waits > 0 else 0.0,
+          "max_wait": metric["max_wait"]
+        }
+      return {"in_flight": self._in_flight, "queued": len(self._queue), "classes": classes}
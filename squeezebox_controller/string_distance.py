@@ -1,4 +1,5 @@
 import math
+import threading
 from collections import deque
 
 """
@@ -68,21 +69,251 @@ def dist(a, b):
       return v
   return d(0,a,b)
 
+_lock = threading.Lock()
+
+def _extend_lower_bounds(bounds, n):
+  correct = _v_weights["correct"]
+  bounds = list(bounds)
+  while len(bounds) <= n:
+    m = len(bounds)
+    bounds.append(min(correct[i] + bounds[m-i] for i in range(1, min(m+1, len(correct)), 3)))
+  return bounds
+
+_lower_bounds = _extend_lower_bounds([0], 64)
+
+def _lower_bound(n):
+  """Smallest value ``dist`` can return for an input of length ``n``, whatever it is compared to."""
+  global _lower_bounds
+  bounds = _lower_bounds
+  if n >= len(bounds):
+    with _lock:
+      if n >= len(_lower_bounds):
+        _lower_bounds = _extend_lower_bounds(_lower_bounds, n)
+      bounds = _lower_bounds
+  return bounds[n]
+
+def parse_regex(regex):
+  """Splits a synonym pattern into its parts.
+
+  Returns a list where each item is either a literal string or a list of alternatives
+  (the empty string being one of them if the group is optional).
+  """
+  parts = []
+  while True:
+    start = regex.find('(')
+    if start == -1:
+      parts.append(regex)
+      return parts
+
+    end = regex.find(')', start+1)
+    if end == -1:
+      raise Exception("bad regex: {}".format(regex))
+
+    options = regex[start+1:end].split('|')
+    if end+1 < len(regex) and regex[end+1] == '?':
+      options.append('')
+      end += 1
+
+    parts.append(regex[:start])
+    parts.append(options)
+    regex = regex[end+1:]
+
+class _Node:
+  __slots__ = ["edges", "key", "tree", "_shortest"]
+
+  def __init__(self, tree=False, key=None):
+    self.edges = {}
+    self.key = key
+    self.tree = tree
+    self._shortest = None
+
+  def shortest(self):
+    """(length, key) of the shortest string accepted from this node"""
+    if self._shortest is None:
+      best = (0, self.key) if self.key is not None else None
+      for char in self.edges:
+        for child in self.edges[char]:
+          length, key = child.shortest()
+          if best is None or (length+1, key) < best:
+            best = (length+1, key)
+      self._shortest = best
+    return self._shortest
+
+class SynonymMatcher:
+  """Fuzzy matcher over a set of named options and their synonym patterns.
+
+  The option names and every synonym are compiled into one automaton which shares common
+  prefixes, so its size grows with the patterns rather than with the number of strings they
+  expand to. ``match`` then finds the option whose name or synonyms are closest (by ``dist``)
+  to the input without expanding the patterns, pruning any branch that cannot beat the threshold.
+
+  Args:
+    options: ``dict[string] -> object``
+      as accepted by ``try_match``
+  """
+
+  def __init__(self, options):
+    self.keys = list(options.keys())
+    self._root = _Node(tree=True)
+    self._terminals = dict((index, _Node(key=index)) for index in range(len(self.keys)))
+    for index, key in enumerate(self.keys):
+      self._add([key.lower()], index)
+      option = options[key]
+      if type(option) == dict and "synonyms" in option:
+        for regex in option["synonyms"]:
+          self._add(parse_regex(regex.lower()), index)
+
+  def _step(self, nodes, char):
+    if len(nodes) == 1 and nodes[0].tree:
+      node = nodes[0]
+      for child in node.edges.get(char, []):
+        if child.tree:
+          return [child]
+      child = _Node(tree=True)
+    else:
+      child = _Node()
+    for node in nodes:
+      node.edges.setdefault(char, []).append(child)
+    return [child]
+
+  def _add(self, parts, index):
+    nodes = [self._root]
+    for part in parts:
+      options = [part] if type(part) == str else part
+      ends = []
+      for option in options:
+        current = nodes
+        for char in option:
+          current = self._step(current, char)
+        ends = ends + [n for n in current if n not in ends]
+      nodes = ends
+    for node in nodes:
+      if node.key is None or index < node.key:
+        node.key = index
+
+  def _windows(self, state, n):
+    """Groups the strings of ``state`` by their first ``n`` characters.
+
+    Yields ``(window, state)`` pairs where ``window`` is either a prefix of length ``n``
+    shared by every string of the returned state, or a whole string shorter than ``n``.
+    """
+    prefix, nodes = state
+    if len(prefix) >= n:
+      yield prefix[:n], state
+      return
+    frontier = {"": nodes}
+    for _ in range(n - len(prefix)):
+      next_frontier = {}
+      for s, current in frontier.items():
+        keys = [node.key for node in current if node.key is not None]
+        if len(keys) > 0:
+          yield prefix + s, (prefix + s, frozenset([self._terminals[min(keys)]]))
+        for node in current:
+          for char, children in node.edges.items():
+            next_frontier.setdefault(s + char, set()).update(children)
+      frontier = next_frontier
+    for s, current in frontier.items():
+      yield prefix + s, (prefix + s, frozenset(current))
+
+  def _shortest(self, state):
+    prefix, nodes = state
+    options = [node.shortest() for node in nodes]
+    length, key = min(o for o in options if o is not None)
+    return (len(prefix) + length, key)
+
+  def search(self, input, limit):
+    """Finds the best ``(score, key index)`` with score at most ``limit``, or ``None``"""
+    mem = {}
+    w = _v_weights
+
+    def d(a, state, limit):
+      if _lower_bound(len(a)) > limit:
+        return None
+      if (a, state) in mem:
+        mem_limit, result = mem[(a, state)]
+        if result is not None:
+          return result if result[0] <= limit else None
+        elif limit <= mem_limit:
+          return None
+
+      best = None
+      def consider(cost, a, state):
+        nonlocal best
+        bound = limit if best is None else min(limit, best[0])
+        r = d(a, state, bound - cost)
+        if r is not None and (best is None or (r[0] + cost, r[1]) < best):
+          best = (r[0] + cost, r[1])
+
+      if len(a) == 0:
+        best = self._shortest(state)
+        if best[0] > limit:
+          best = None
+      else:
+        for b, (p, nodes) in self._windows(state, len(a)):
+          if len(b) == 0:
+            key = min(node.key for node in nodes)
+            if len(a) <= limit and (best is None or (len(a), key) < best):
+              best = (len(a), key)
+            continue
+          minlen = min(len(a), len(b)) + 1
+          for i in reversed(range(1, minlen, 3)):
+            if a[:i] == b[:i]:
+              consider(w["correct"][i], a[i:], (p[i:], nodes))
+              consider(w["add"][i], a, (p[i:], nodes))
+              consider(w["sub"][i], a[i:], (p, nodes))
+              break
+            else:
+              consider(w["swap"][i], a[i:], (p[i:], nodes))
+              consider(w["add"][i], a, (p[i:], nodes))
+              consider(w["sub"][i], a[i:], (p, nodes))
+
+          if len(a) > 1 and len(b) > 1:
+            for i in range(5, minlen, 2):
+              for j in range(i, minlen-i):
+                if a[:i] == b[j:j+i]:
+                  consider(w["trans"][i], a[i:], (p[:j] + p[j+i:], nodes))
+                if a[j:j+i] == b[:i]:
+                  consider(w["trans"][i], a[:j] + a[j+i:], (p[i:], nodes))
+
+      mem[(a, state)] = (limit, best)
+      return best
+
+    return d(input, ("", frozenset([self._root])), limit)
+
+  def match(self, input, threshold=5):
+    """Returns the option closest to ``input`` if it scores below ``threshold``, else ``None``"""
+    if len(self.keys) == 0:
+      return None
+    best = self.search(input.lower(), math.ceil(threshold) - 1)
+    if best is None:
+      return None
+    return self.keys[best[1]]
+
+_matchers = {}
+
+def _get_matcher(options):
+  signature = tuple(
+    (key, tuple(options[key]["synonyms"]) if type(options[key]) == dict and "synonyms" in options[key] else ())
+    for key in options
+  )
+  with _lock:
+    matcher = _matchers.get(signature)
+    if matcher is None:
+      if len(_matchers) >= 32:
+        _matchers.clear()
+      matcher = SynonymMatcher(options)
+      _matchers[signature] = matcher
+    return matcher
+
 def try_match(input, options, threshold=5):
-  input = input.lower()
-  scores = []
-  for key in options:
-    option = options[key]
-    scores.append((key, dist(input, key.lower())))
-    if type(option) == dict and "synonyms" in option:
-      for regex in option["synonyms"]:
-        for text in enumerate_regex(regex.lower()):
-          scores.append((key, dist(input, text.lower())))
-  best = min(scores, key=lambda x: x[1])
-  if best[1] < threshold:
-    return best[0]
-  else:
-    return None
+  """Finds the option best matching the input
+
+  Compares the input against each key of ``options`` and, for dict values, the patterns in their
+  ``synonyms`` list. The compiled matcher is reused between calls with the same options.
+
+  Returns the best key if its ``dist`` is below ``threshold``, otherwise ``None``.
+  """
+  return _get_matcher(options).match(input, threshold)
 
 
 def enumerate_regex(regex):
@@ -48,3 +48,317 @@ sbc.simple_command({"player": players[0]["name"], "command": "PLAY"})
 requests_lib.post.assert_called_once_with(url, json=get_req_json([players[0]["playerid"], ["play"]]))
 
 
+
+requests_lib.post.reset_mock()
+sbc.simple_command({"player": "B", "command": "turn up"})
+requests_lib.post.assert_called_once_with(url, json=get_req_json([players[1]["playerid"], ["mixer","volume","+20"]]))
+
+from squeezebox_controller.gateway import SqueezeBoxGateway, SqueezeBoxClient
+
+gateway = SqueezeBoxGateway(sbc, port=0, default_player="a")
+gateway.start()
+client = SqueezeBoxClient(gateway.host, gateway.port)
+
+requests_lib.post.reset_mock()
+client.simple_command({"player": players[0]["name"], "command": "PAUSE"})
+requests_lib.post.assert_called_once_with(url, json=get_req_json([players[0]["playerid"], ["pause"]]))
+assert client.player_macs["b"] == players[1]["playerid"]
+
+try:
+  client.search_and_play({"player": "a", "term": "", "type": "SONG"})
+  assert False
+except UserException:
+  pass
+
+other_client = SqueezeBoxClient(gateway.host, gateway.port)
+client.simple_command({"player": "b", "command": "PLAY"})
+requests_lib.post.reset_mock()
+other_client.simple_command({"command": "PAUSE"})
+requests_lib.post.assert_called_once_with(url, json=get_req_json([players[0]["playerid"], ["pause"]]))
+requests_lib.post.reset_mock()
+client.simple_command({"command": "PAUSE"})
+requests_lib.post.assert_called_once_with(url, json=get_req_json([players[1]["playerid"], ["pause"]]))
+
+assert requests.post("http://%s:%d/simple_command"%(gateway.host, gateway.port), json=[1]).status_code == 400
+
+sbc.add_custom_command("who", lambda helper, details: details["player"])
+first_client = SqueezeBoxClient(gateway.host, gateway.port)
+second_client = SqueezeBoxClient(gateway.host, gateway.port)
+first_client.simple_command({"player": "b", "command": "PLAY"})
+assert second_client.custom_command("who", {}) == "a"
+assert first_client.custom_command("who", {}) == "b"
+
+gateway.shutdown()
+
+import io
+from squeezebox_controller.cli import run_pipeline
+
+requests_lib.post.reset_mock()
+out = io.StringIO()
+lines = [
+  '{"action": "volume", "player": "a", "percent": 10}',
+  '{"action": "command", "command": "PLAY"}',
+  '{"action": "command", "player": "b", "command": "PAUSE"}',
+  'not json'
+]
+assert run_pipeline(sbc, lines, out, concurrency=2) == 1
+results = sorted([json_lib.loads(l) for l in out.getvalue().splitlines()], key=lambda r: r["line"])
+assert [r["line"] for r in results] == [1, 2, 3, 4]
+assert "error" in results[3]
+a_calls = [c for c in requests_lib.post.call_args_list if c[1]["json"]["params"][0] == players[0]["playerid"]]
+assert [c[1]["json"]["params"][1] for c in a_calls] == [["mixer", "volume", "10"], ["play"]]
+
+from squeezebox_controller.federated import FederatedSqueezeBoxController
+
+server_players = {
+  "http://10.0.0.1:9000/jsonrpc.js": [{"name": "a", "playerid": "1"}, {"name": "c", "playerid": "3"}],
+  "http://10.0.0.2:9000/jsonrpc.js": [{"name": "a", "playerid": "4"}, {"name": "d", "playerid": "5"}]
+}
+
+def federated_handle(end_point_url, json):
+  command = json["params"][1]
+  if command == ["player", "count", "?"]:
+    ret_val = {"result": {"_count": len(server_players[end_point_url])}}
+  elif command[0] == "players":
+    ret_val = {"result": {"players_loop": server_players[end_point_url]}}
+  else:
+    ret_val = {"result": "success"}
+  ret = Mock()
+  ret.content = json_lib.dumps(ret_val).encode("utf-8")
+  return ret
+
+federated_lib = Mock(spec=requests)
+federated_lib.post = Mock(side_effect=federated_handle)
+federated = FederatedSqueezeBoxController(["10.0.0.1", "10.0.0.2:9000"], request_lib=federated_lib)
+assert set(federated.player_macs.keys()) == {"a (10.0.0.1:9000)", "a (10.0.0.2:9000)", "c", "d", "ALL"}
+
+federated_lib.post.reset_mock()
+federated.simple_command({"player": "d", "command": "PLAY"})
+federated_lib.post.assert_called_once_with("http://10.0.0.2:9000/jsonrpc.js", json=get_req_json(["5", ["play"]]))
+
+federated_lib.post.reset_mock()
+federated.simple_command({"player": "ALL", "command": "PAUSE"})
+assert federated_lib.post.call_count == 4
+
+server_players["http://10.0.0.1:9000/jsonrpc.js"].append({"name": "e", "playerid": "00:04:20:00:00:01"})
+server_players["http://10.0.0.1:9000/jsonrpc.js"].append({"name": "f", "playerid": "00:04:20:00:00:02"})
+server_players["http://10.0.0.2:9000/jsonrpc.js"].append({"name": "g", "playerid": "00:04:20:00:00:03"})
+federated = FederatedSqueezeBoxController(["10.0.0.1", "10.0.0.2"], request_lib=federated_lib)
+
+federated_lib.post.reset_mock()
+federated.sync_player({"player": "e", "other": "f"})
+federated_lib.post.assert_any_call("http://10.0.0.1:9000/jsonrpc.js", json=get_req_json(["00:04:20:00:00:02", ["sync", "00:04:20:00:00:01"]]))
+federated.send_music({"player": "e", "other": "f", "direction": "TO"})
+federated_lib.post.assert_called_with("http://10.0.0.1:9000/jsonrpc.js",
+  json=get_req_json(["00:04:20:00:00:01", ["switchplayer", "from:00:04:20:00:00:01", "to:00:04:20:00:00:02"]]))
+for f in (federated.sync_player, federated.send_music):
+  try:
+    f({"player": "e", "other": "g", "direction": "TO"})
+    assert False
+  except Exception as e:
+    assert "different servers" in str(e)
+
+federated_lib.post.reset_mock()
+federated._make_request("-", ["player", "count", "?"])
+federated_lib.post.assert_called_once_with("http://10.0.0.1:9000/jsonrpc.js", json=get_req_json(["-", ["player", "count", "?"]]))
+
+import threading
+import time
+from squeezebox_controller.scheduler import RequestScheduler, RequestShed
+
+release = threading.Event()
+def blocking_handle(*args, **kargs):
+  release.wait()
+  return handle(*args, **kargs)
+
+blocking_lib = Mock(spec=requests)
+blocking_lib.post = Mock(side_effect=blocking_handle)
+scheduler = RequestScheduler(blocking_lib, max_concurrent=1, max_queue=1)
+scheduled = SqueezeBoxController(ip, request_lib=requests_lib)
+scheduled.request_lib = scheduler
+
+outcomes = {}
+def run(name, f):
+  try:
+    f()
+    outcomes[name] = "ok"
+  except RequestShed:
+    outcomes[name] = "shed"
+
+threads = [
+  threading.Thread(target=run, args=("play", lambda: scheduled.simple_command({"player": "a", "command": "PLAY"})))
+]
+threads[0].start()
+while scheduler.stats()["in_flight"] < 1: time.sleep(0.01)
+threads.append(threading.Thread(target=run, args=("poll", lambda: scheduled._get_player_info(players[0]["playerid"]))))
+threads[1].start()
+while scheduler.stats()["queued"] < 1: time.sleep(0.01)
+threads.append(threading.Thread(target=run, args=("pause", lambda: scheduled.simple_command({"player": "a", "command": "PAUSE"}))))
+threads[2].start()
+threads[1].join()
+release.set()
+for t in threads: t.join()
+assert outcomes == {"play": "ok", "poll": "shed", "pause": "ok"}
+stats = scheduler.stats()
+assert stats["classes"]["polling"]["shed"] == 1 and stats["classes"]["interactive"]["dispatched"] == 2
+
+scheduled.simple_query({"player": "a", "query": "RAW"})
+assert scheduler.stats()["classes"]["interactive"]["dispatched"] == 3
+
+from squeezebox_controller.resilience import ResilientRequestLib, CircuitOpen
+
+failures_left = [1]
+def flaky_handle(*args, **kargs):
+  assert kargs.pop("timeout") > 0
+  if failures_left[0] > 0:
+    failures_left[0] -= 1
+    raise requests.exceptions.ConnectionError("reset")
+  return handle(*args, **kargs)
+
+flaky_lib = Mock(spec=requests)
+flaky_lib.post = Mock(side_effect=flaky_handle)
+resilient = ResilientRequestLib(flaky_lib, backoff=0, failure_threshold=2, reset_after=60)
+sbc.request_lib = resilient
+
+sbc.simple_query({"player": "a", "query": "RAW"})
+assert resilient.stats()["retries"] == 1
+
+failures_left[0] = 2
+for _ in range(2):
+  try:
+    sbc.simple_command({"player": "a", "command": "PLAY"})
+    assert False
+  except requests.exceptions.ConnectionError:
+    pass
+try:
+  sbc.simple_command({"player": "a", "command": "PLAY"})
+  assert False
+except CircuitOpen:
+  pass
+assert resilient.stats()["circuit"] == "open"
+sbc.request_lib = requests_lib
+
+import os
+import tempfile
+from squeezebox_controller.recording import RecordingRequestLib, ReplayRequestLib
+
+recording_path = os.path.join(tempfile.mkdtemp(), "traffic.jsonl.gz")
+with RecordingRequestLib(recording_path, requests_lib) as recorder:
+  recorded = SqueezeBoxController(ip, request_lib=recorder)
+  recorded.simple_command({"player": "b", "command": "PLAY"})
+
+replay = ReplayRequestLib(recording_path, latency="none")
+replayed = SqueezeBoxController(ip, request_lib=replay)
+replayed.simple_command({"player": "b", "command": "PLAY"})
+assert replayed.player_macs == recorded.player_macs
+assert replay.stats() == {"hits": 3, "misses": 0}
+
+from squeezebox_controller import queries
+from squeezebox_controller.records import PlayerStatus, Track, from_loop
+
+status_json = {"mixer volume": 40, "playlist_loop": [{"id": 7, "title": "Song", "artist": "Band", "album": "Album"}]}
+status = PlayerStatus.from_json(status_json)
+assert status.playlist == (Track(7, "Song", "Band", "Album"),)
+for query in ["VOLUME", "NOW PLAYING"]:
+  assert queries[query](status) == queries[query](status_json)
+assert queries["NOW PLAYING"]({}) == "Nothing is playing"
+assert from_loop("players_loop", players)[1].id == players[1]["playerid"]
+
+statuses = {
+  "1": {"power": 0, "mixer volume": 50, "playlist shuffle": 0},
+  "2": {"power": 1, "mixer volume": 30, "playlist shuffle": 0}
+}
+def scene_handle(*args, **kargs):
+  player, command = kargs["json"]["params"]
+  if command == ["status", "-"]:
+    ret = Mock()
+    ret.content = json_lib.dumps({"result": statuses[player]}).encode("utf-8")
+    return ret
+  return handle(*args, **kargs)
+
+requests_lib.post = Mock(side_effect=scene_handle)
+report = sbc.apply_scene({
+  "sync": [["a", "b"]],
+  "players": {"a": {"power": True, "volume": 50}, "b": {"volume": 30, "shuffle": 1}}
+})
+assert [(s["player"], s["step"]) for s in report["steps"] if "error" not in s] == \
+  [(None, "status"), ("a", "sync b"), ("a", "power"), ("a", "shuffle")]
+sent = [c[1]["json"]["params"] for c in requests_lib.post.call_args_list if c[1]["json"]["params"][1] != ["status", "-"]]
+assert sent == [["1", ["sync", "2"]], ["1", ["power", "1"]], ["1", ["playlist", "shuffle", 1]]]
+
+for bad_scene, message in [
+  ({"sync": [["a", "b"], ["B"]]}, "more than one sync group"),
+  ({"sync": [["a", "a"]]}, "more than one sync group"),
+  ({"players": {"a": {}, "A": {}}}, "more than once"),
+  ({"sync": [["a", "b"]], "players": {"a": {"play": {"term": "x"}}, "b": {"play": {"term": "y"}}}}, "Only one player"),
+  ({"sync": [["a", "b"]], "players": {"a": {"shuffle": 0}, "b": {"shuffle": 1}}}, "different shuffle")
+]:
+  requests_lib.post.reset_mock()
+  try:
+    sbc.apply_scene(bad_scene)
+    assert False
+  except Exception as e:
+    assert message in str(e)
+  assert requests_lib.post.call_count == 0
+requests_lib.post = Mock(side_effect=handle)
+
+from concurrent.futures import ThreadPoolExecutor
+from squeezebox_controller import commands
+from squeezebox_controller.string_distance import try_match
+
+with ThreadPoolExecutor(max_workers=8) as pool:
+  matched = list(pool.map(lambda i: try_match(["turn up", "skip song", "pause"][i % 3], commands), range(48)))
+assert matched == ["VOLUME UP", "SKIP", "PAUSE"] * 16
+
+b_started = threading.Event()
+def lane_handle(*args, **kargs):
+  player, command = kargs["json"]["params"]
+  if player == players[1]["playerid"]:
+    b_started.set()
+  elif command == ["play"]:
+    assert b_started.wait(5)
+  return handle(*args, **kargs)
+
+requests_lib.post = Mock(side_effect=lane_handle)
+out = io.StringIO()
+lines = [
+  '{"action": "command", "player": "A", "command": "PLAY"}',
+  '{"action": "command", "player": "a", "command": "PAUSE"}',
+  '{"action": "command", "player": "b", "command": "PAUSE"}'
+]
+assert run_pipeline(sbc, lines, out, concurrency=2) == 0
+a_calls = [c[1]["json"]["params"][1] for c in requests_lib.post.call_args_list if c[1]["json"]["params"][0] == players[0]["playerid"]]
+assert a_calls == [["play"], ["pause"]]
+requests_lib.post = Mock(side_effect=handle)
+
+requests_lib.post = Mock(side_effect=scene_handle)
+try:
+  sbc.apply_scene({"players": {"a": {"volume": 150}}})
+  assert False
+except Exception as e:
+  assert "between 0 and 100" in str(e)
+assert requests_lib.post.call_count == 0
+
+gateway = SqueezeBoxGateway(sbc, port=0, default_player="a")
+gateway.start()
+client = SqueezeBoxClient(gateway.host, gateway.port, "b")
+report = client.apply_scene({"players": {"b": {"volume": 40}}})
+assert [(s["player"], s["step"]) for s in report["steps"]] == [(None, "status"), ("b", "volume")]
+gateway.shutdown()
+
+out = io.StringIO()
+assert run_pipeline(sbc, ['{"action": "scene", "players": {"a": {"power": true}}}'], out) == 0
+assert json_lib.loads(out.getvalue())["result"]["steps"][1]["step"] == "power"
+requests_lib.post = Mock(side_effect=handle)
+assert try_match("hc", {"pause": {}, "kitchen": {}}, 17.5) == "pause"
+assert try_match("hc", {"pause": {}, "kitchen": {}}, 17) is None
+
+breaker = ResilientRequestLib(requests_lib, failure_threshold=1, reset_after=0)
+breaker._opened_at = time.time()
+assert breaker._check_circuit()
+breaker._record_outcome(False, False)
+try:
+  breaker._check_circuit()
+  assert False
+except CircuitOpen:
+  pass